@@ -1089,8 +1089,8 @@ def apply_filters_to_image(slide_num, save=True, display=False):
 
   info = dict()
 
-  if save and not os.path.exists(slide.FILTER_DIR):
-    os.makedirs(slide.FILTER_DIR)
+  if save:
+    os.makedirs(slide.FILTER_DIR, exist_ok=True)
   img_path = slide.get_training_image_path(slide_num)
   np_orig = slide.open_image_np(img_path)
   filtered_np_img = apply_image_filters(np_orig, slide_num, info, save=save, display=display)
@@ -1398,8 +1398,8 @@ def multiprocess_apply_filters_to_images(save=True, display=False, html=True, im
   timer = Time()
   print("Applying filters to images (multiprocess)\n")
 
-  if save and not os.path.exists(slide.FILTER_DIR):
-    os.makedirs(slide.FILTER_DIR)
+  if save:
+    os.makedirs(slide.FILTER_DIR, exist_ok=True)
 
   # how many processes to use
   num_processes = multiprocessing.cpu_count()
@@ -14,9 +14,10 @@
 #
 # ------------------------------------------------------------------------
 
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import glob
 import math
-import matplotlib.pyplot as plt
 import multiprocessing
 import numpy as np
 import openslide
@@ -24,8 +25,6 @@ from openslide import OpenSlideError
 import os
 import PIL
 from PIL import Image
-import re
-import sys
 from deephistopath.wsi import util
 from deephistopath.wsi.util import Time
 
@@ -37,9 +36,11 @@ SRC_TRAIN_EXT = "svs"
 DEST_TRAIN_SUFFIX = ""  # Example: "train-"
 DEST_TRAIN_EXT = "png"
 SCALE_FACTOR = 32
+SCALE_TILE_SIZE = 4096  # Size of the level regions read when scaling down a slide
 DEST_TRAIN_DIR = os.path.join(BASE_DIR, "training_" + DEST_TRAIN_EXT)
 THUMBNAIL_SIZE = 300
 THUMBNAIL_EXT = "jpg"
+THUMBNAIL_JPEG_QUALITY = 85
 
 DEST_TRAIN_THUMBNAIL_DIR = os.path.join(BASE_DIR, "training_thumbnail_" + THUMBNAIL_EXT)
 
@@ -137,8 +138,7 @@ def get_training_slide_path(slide_number):
   Returns:
     Path to the WSI training slide file.
   """
-  padded_sl_num = str(slide_number).zfill(3)
-  slide_filepath = os.path.join(SRC_TRAIN_DIR, TRAIN_PREFIX + padded_sl_num + "." + SRC_TRAIN_EXT)
+  slide_filepath = os.path.join(SRC_TRAIN_DIR, f"{TRAIN_PREFIX}{slide_number:03d}.{SRC_TRAIN_EXT}")
   return slide_filepath
 
 
@@ -154,10 +154,10 @@ def get_tile_image_path(tile):
     Path to image tile.
   """
   t = tile
-  padded_sl_num = str(t.slide_num).zfill(3)
+  padded_sl_num = f"{t.slide_num:03d}"
   tile_path = os.path.join(TILE_DIR, padded_sl_num,
-                           TRAIN_PREFIX + padded_sl_num + "-" + TILE_SUFFIX + "-r%d-c%d-x%d-y%d-w%d-h%d" % (
-                             t.r, t.c, t.o_c_s, t.o_r_s, t.o_c_e - t.o_c_s, t.o_r_e - t.o_r_s) + "." + DEST_TRAIN_EXT)
+                           f"{TRAIN_PREFIX}{padded_sl_num}-{TILE_SUFFIX}-r{t.r}-c{t.c}-x{t.o_c_s}-y{t.o_r_s}"
+                           f"-w{t.o_c_e - t.o_c_s}-h{t.o_r_e - t.o_r_s}.{DEST_TRAIN_EXT}")
   return tile_path
 
 
@@ -173,10 +173,9 @@ def get_tile_image_path_by_slide_row_col(slide_number, row, col):
   Returns:
     Path to image tile.
   """
-  padded_sl_num = str(slide_number).zfill(3)
+  padded_sl_num = f"{slide_number:03d}"
   wilcard_path = os.path.join(TILE_DIR, padded_sl_num,
-                              TRAIN_PREFIX + padded_sl_num + "-" + TILE_SUFFIX + "-r%d-c%d-*." % (
-                                row, col) + DEST_TRAIN_EXT)
+                              f"{TRAIN_PREFIX}{padded_sl_num}-{TILE_SUFFIX}-r{row}-c{col}-*.{DEST_TRAIN_EXT}")
   img_path = glob.glob(wilcard_path)[0]
   return img_path
 
@@ -199,14 +198,11 @@ def get_training_image_path(slide_number, large_w=None, large_h=None, small_w=No
   Returns:
      Path to the image file.
   """
-  padded_sl_num = str(slide_number).zfill(3)
   if large_w is None and large_h is None and small_w is None and small_h is None:
-    wildcard_path = os.path.join(DEST_TRAIN_DIR, TRAIN_PREFIX + padded_sl_num + "*." + DEST_TRAIN_EXT)
-    img_path = glob.glob(wildcard_path)[0]
+    img_path = lookup_training_image_path(slide_number)
   else:
-    img_path = os.path.join(DEST_TRAIN_DIR, TRAIN_PREFIX + padded_sl_num + "-" + str(
-      SCALE_FACTOR) + "x-" + DEST_TRAIN_SUFFIX + str(
-      large_w) + "x" + str(large_h) + "-" + str(small_w) + "x" + str(small_h) + "." + DEST_TRAIN_EXT)
+    img_path = os.path.join(DEST_TRAIN_DIR, f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-{DEST_TRAIN_SUFFIX}"
+                                            f"{large_w}x{large_h}-{small_w}x{small_h}.{DEST_TRAIN_EXT}")
   return img_path
 
 
@@ -228,14 +224,58 @@ def get_training_thumbnail_path(slide_number, large_w=None, large_h=None, small_
   Returns:
      Path to the thumbnail file.
   """
-  padded_sl_num = str(slide_number).zfill(3)
   if large_w is None and large_h is None and small_w is None and small_h is None:
-    wilcard_path = os.path.join(DEST_TRAIN_THUMBNAIL_DIR, TRAIN_PREFIX + padded_sl_num + "*." + THUMBNAIL_EXT)
-    img_path = glob.glob(wilcard_path)[0]
+    img_path = lookup_training_thumbnail_path(slide_number)
   else:
-    img_path = os.path.join(DEST_TRAIN_THUMBNAIL_DIR, TRAIN_PREFIX + padded_sl_num + "-" + str(
-      SCALE_FACTOR) + "x-" + DEST_TRAIN_SUFFIX + str(
-      large_w) + "x" + str(large_h) + "-" + str(small_w) + "x" + str(small_h) + "." + THUMBNAIL_EXT)
+    img_path = os.path.join(DEST_TRAIN_THUMBNAIL_DIR, f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-"
+                                                      f"{DEST_TRAIN_SUFFIX}{large_w}x{large_h}-{small_w}x{small_h}"
+                                                      f".{THUMBNAIL_EXT}")
+  return img_path
+
+
+@functools.lru_cache(maxsize=None)
+def glob_first(wildcard_path):
+  """
+  Obtain the first file matching a wildcard path. Results are cached on the full wildcard path, so changing a
+  directory or prefix results in a new lookup, but a matching file that is removed or renamed during the session
+  is not noticed.
+
+  Args:
+    wildcard_path: The wildcard path.
+
+  Returns:
+    Path to the first matching file.
+  """
+  return glob.glob(wildcard_path)[0]
+
+
+def lookup_training_image_path(slide_number):
+  """
+  Look up the training image file for a slide number in the file system using a wildcard.
+
+  Args:
+    slide_number: The slide number.
+
+  Returns:
+     Path to the image file.
+  """
+  wildcard_path = os.path.join(DEST_TRAIN_DIR, f"{TRAIN_PREFIX}{slide_number:03d}*.{DEST_TRAIN_EXT}")
+  img_path = glob_first(wildcard_path)
+  return img_path
+
+
+def lookup_training_thumbnail_path(slide_number):
+  """
+  Look up the training thumbnail file for a slide number in the file system using a wildcard.
+
+  Args:
+    slide_number: The slide number.
+
+  Returns:
+     Path to the thumbnail file.
+  """
+  wilcard_path = os.path.join(DEST_TRAIN_THUMBNAIL_DIR, f"{TRAIN_PREFIX}{slide_number:03d}*.{THUMBNAIL_EXT}")
+  img_path = glob_first(wilcard_path)
   return img_path
 
 
@@ -255,8 +295,7 @@ def get_filter_image_path(slide_number, filter_number, filter_name_info):
     Path to the filter image file.
   """
   dir = FILTER_DIR
-  if not os.path.exists(dir):
-    os.makedirs(dir)
+  os.makedirs(dir, exist_ok=True)
   img_path = os.path.join(dir, get_filter_image_filename(slide_number, filter_number, filter_name_info))
   return img_path
 
@@ -277,8 +316,7 @@ def get_filter_thumbnail_path(slide_number, filter_number, filter_name_info):
     Path to the filter thumbnail file.
   """
   dir = FILTER_THUMBNAIL_DIR
-  if not os.path.exists(dir):
-    os.makedirs(dir)
+  os.makedirs(dir, exist_ok=True)
   img_path = os.path.join(dir, get_filter_image_filename(slide_number, filter_number, filter_name_info, thumbnail=True))
   return img_path
 
@@ -304,9 +342,7 @@ def get_filter_image_filename(slide_number, filter_number, filter_name_info, thu
     ext = THUMBNAIL_EXT
   else:
     ext = DEST_TRAIN_EXT
-  padded_sl_num = str(slide_number).zfill(3)
-  padded_fi_num = str(filter_number).zfill(3)
-  img_filename = TRAIN_PREFIX + padded_sl_num + "-" + padded_fi_num + "-" + FILTER_SUFFIX + filter_name_info + "." + ext
+  img_filename = f"{TRAIN_PREFIX}{slide_number:03d}-{filter_number:03d}-{FILTER_SUFFIX}{filter_name_info}.{ext}"
   return img_filename
 
 
@@ -323,8 +359,7 @@ def get_tile_summary_image_path(slide_number):
   Returns:
     Path to the tile summary image file.
   """
-  if not os.path.exists(TILE_SUMMARY_DIR):
-    os.makedirs(TILE_SUMMARY_DIR)
+  os.makedirs(TILE_SUMMARY_DIR, exist_ok=True)
   img_path = os.path.join(TILE_SUMMARY_DIR, get_tile_summary_image_filename(slide_number))
   return img_path
 
@@ -342,8 +377,7 @@ def get_tile_summary_thumbnail_path(slide_number):
   Returns:
     Path to the tile summary thumbnail file.
   """
-  if not os.path.exists(TILE_SUMMARY_THUMBNAIL_DIR):
-    os.makedirs(TILE_SUMMARY_THUMBNAIL_DIR)
+  os.makedirs(TILE_SUMMARY_THUMBNAIL_DIR, exist_ok=True)
   img_path = os.path.join(TILE_SUMMARY_THUMBNAIL_DIR, get_tile_summary_image_filename(slide_number, thumbnail=True))
   return img_path
 
@@ -361,8 +395,7 @@ def get_tile_summary_on_original_image_path(slide_number):
   Returns:
     Path to the tile summary on original image file.
   """
-  if not os.path.exists(TILE_SUMMARY_ON_ORIGINAL_DIR):
-    os.makedirs(TILE_SUMMARY_ON_ORIGINAL_DIR)
+  os.makedirs(TILE_SUMMARY_ON_ORIGINAL_DIR, exist_ok=True)
   img_path = os.path.join(TILE_SUMMARY_ON_ORIGINAL_DIR, get_tile_summary_image_filename(slide_number))
   return img_path
 
@@ -380,8 +413,7 @@ def get_tile_summary_on_original_thumbnail_path(slide_number):
   Returns:
     Path to the tile summary on original thumbnail file.
   """
-  if not os.path.exists(TILE_SUMMARY_ON_ORIGINAL_THUMBNAIL_DIR):
-    os.makedirs(TILE_SUMMARY_ON_ORIGINAL_THUMBNAIL_DIR)
+  os.makedirs(TILE_SUMMARY_ON_ORIGINAL_THUMBNAIL_DIR, exist_ok=True)
   img_path = os.path.join(TILE_SUMMARY_ON_ORIGINAL_THUMBNAIL_DIR,
                           get_tile_summary_image_filename(slide_number, thumbnail=True))
   return img_path
@@ -400,8 +432,7 @@ def get_top_tiles_on_original_image_path(slide_number):
   Returns:
     Path to the top tiles on original image file.
   """
-  if not os.path.exists(TOP_TILES_ON_ORIGINAL_DIR):
-    os.makedirs(TOP_TILES_ON_ORIGINAL_DIR)
+  os.makedirs(TOP_TILES_ON_ORIGINAL_DIR, exist_ok=True)
   img_path = os.path.join(TOP_TILES_ON_ORIGINAL_DIR, get_top_tiles_image_filename(slide_number))
   return img_path
 
@@ -419,8 +450,7 @@ def get_top_tiles_on_original_thumbnail_path(slide_number):
   Returns:
     Path to the top tiles on original thumbnail file.
   """
-  if not os.path.exists(TOP_TILES_ON_ORIGINAL_THUMBNAIL_DIR):
-    os.makedirs(TOP_TILES_ON_ORIGINAL_THUMBNAIL_DIR)
+  os.makedirs(TOP_TILES_ON_ORIGINAL_THUMBNAIL_DIR, exist_ok=True)
   img_path = os.path.join(TOP_TILES_ON_ORIGINAL_THUMBNAIL_DIR,
                           get_top_tiles_image_filename(slide_number, thumbnail=True))
   return img_path
@@ -445,12 +475,9 @@ def get_tile_summary_image_filename(slide_number, thumbnail=False):
     ext = THUMBNAIL_EXT
   else:
     ext = DEST_TRAIN_EXT
-  padded_sl_num = str(slide_number).zfill(3)
-
-  training_img_path = get_training_image_path(slide_number)
-  large_w, large_h, small_w, small_h = parse_dimensions_from_image_filename(training_img_path)
-  img_filename = TRAIN_PREFIX + padded_sl_num + "-" + str(SCALE_FACTOR) + "x-" + str(large_w) + "x" + str(
-    large_h) + "-" + str(small_w) + "x" + str(small_h) + "-" + TILE_SUMMARY_SUFFIX + "." + ext
+  large_w, large_h, small_w, small_h = get_training_image_dimensions(slide_number)
+  img_filename = (f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-{large_w}x{large_h}-{small_w}x{small_h}"
+                  f"-{TILE_SUMMARY_SUFFIX}.{ext}")
 
   return img_filename
 
@@ -474,12 +501,9 @@ def get_top_tiles_image_filename(slide_number, thumbnail=False):
     ext = THUMBNAIL_EXT
   else:
     ext = DEST_TRAIN_EXT
-  padded_sl_num = str(slide_number).zfill(3)
-
-  training_img_path = get_training_image_path(slide_number)
-  large_w, large_h, small_w, small_h = parse_dimensions_from_image_filename(training_img_path)
-  img_filename = TRAIN_PREFIX + padded_sl_num + "-" + str(SCALE_FACTOR) + "x-" + str(large_w) + "x" + str(
-    large_h) + "-" + str(small_w) + "x" + str(small_h) + "-" + TOP_TILES_SUFFIX + "." + ext
+  large_w, large_h, small_w, small_h = get_training_image_dimensions(slide_number)
+  img_filename = (f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-{large_w}x{large_h}-{small_w}x{small_h}"
+                  f"-{TOP_TILES_SUFFIX}.{ext}")
 
   return img_filename
 
@@ -497,8 +521,7 @@ def get_top_tiles_image_path(slide_number):
   Returns:
     Path to the top tiles image file.
   """
-  if not os.path.exists(TOP_TILES_DIR):
-    os.makedirs(TOP_TILES_DIR)
+  os.makedirs(TOP_TILES_DIR, exist_ok=True)
   img_path = os.path.join(TOP_TILES_DIR, get_top_tiles_image_filename(slide_number))
   return img_path
 
@@ -515,8 +538,7 @@ def get_top_tiles_thumbnail_path(slide_number):
   Returns:
     Path to the top tiles thumbnail file.
   """
-  if not os.path.exists(TOP_TILES_THUMBNAIL_DIR):
-    os.makedirs(TOP_TILES_THUMBNAIL_DIR)
+  os.makedirs(TOP_TILES_THUMBNAIL_DIR, exist_ok=True)
   img_path = os.path.join(TOP_TILES_THUMBNAIL_DIR, get_top_tiles_image_filename(slide_number, thumbnail=True))
   return img_path
 
@@ -534,12 +556,9 @@ def get_tile_data_filename(slide_number):
   Returns:
     The tile data file name.
   """
-  padded_sl_num = str(slide_number).zfill(3)
-
-  training_img_path = get_training_image_path(slide_number)
-  large_w, large_h, small_w, small_h = parse_dimensions_from_image_filename(training_img_path)
-  data_filename = TRAIN_PREFIX + padded_sl_num + "-" + str(SCALE_FACTOR) + "x-" + str(large_w) + "x" + str(
-    large_h) + "-" + str(small_w) + "x" + str(small_h) + "-" + TILE_DATA_SUFFIX + ".csv"
+  large_w, large_h, small_w, small_h = get_training_image_dimensions(slide_number)
+  data_filename = (f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-{large_w}x{large_h}-{small_w}x{small_h}"
+                   f"-{TILE_DATA_SUFFIX}.csv")
 
   return data_filename
 
@@ -557,8 +576,7 @@ def get_tile_data_path(slide_number):
   Returns:
     Path to the tile data file.
   """
-  if not os.path.exists(TILE_DATA_DIR):
-    os.makedirs(TILE_DATA_DIR)
+  os.makedirs(TILE_DATA_DIR, exist_ok=True)
   file_path = os.path.join(TILE_DATA_DIR, get_tile_data_filename(slide_number))
   return file_path
 
@@ -576,12 +594,9 @@ def get_filter_image_result(slide_number):
   Returns:
     Path to the filter image file.
   """
-  padded_sl_num = str(slide_number).zfill(3)
-  training_img_path = get_training_image_path(slide_number)
-  large_w, large_h, small_w, small_h = parse_dimensions_from_image_filename(training_img_path)
-  img_path = os.path.join(FILTER_DIR, TRAIN_PREFIX + padded_sl_num + "-" + str(
-    SCALE_FACTOR) + "x-" + FILTER_SUFFIX + str(large_w) + "x" + str(large_h) + "-" + str(small_w) + "x" + str(
-    small_h) + "-" + FILTER_RESULT_TEXT + "." + DEST_TRAIN_EXT)
+  large_w, large_h, small_w, small_h = get_training_image_dimensions(slide_number)
+  img_path = os.path.join(FILTER_DIR, f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-{FILTER_SUFFIX}"
+                                      f"{large_w}x{large_h}-{small_w}x{small_h}-{FILTER_RESULT_TEXT}.{DEST_TRAIN_EXT}")
   return img_path
 
 
@@ -598,18 +613,32 @@ def get_filter_thumbnail_result(slide_number):
   Returns:
     Path to the filter thumbnail file.
   """
-  padded_sl_num = str(slide_number).zfill(3)
-  training_img_path = get_training_image_path(slide_number)
-  large_w, large_h, small_w, small_h = parse_dimensions_from_image_filename(training_img_path)
-  img_path = os.path.join(FILTER_THUMBNAIL_DIR, TRAIN_PREFIX + padded_sl_num + "-" + str(
-    SCALE_FACTOR) + "x-" + FILTER_SUFFIX + str(large_w) + "x" + str(large_h) + "-" + str(small_w) + "x" + str(
-    small_h) + "-" + FILTER_RESULT_TEXT + "." + THUMBNAIL_EXT)
+  large_w, large_h, small_w, small_h = get_training_image_dimensions(slide_number)
+  img_path = os.path.join(FILTER_THUMBNAIL_DIR, f"{TRAIN_PREFIX}{slide_number:03d}-{SCALE_FACTOR}x-{FILTER_SUFFIX}"
+                                                f"{large_w}x{large_h}-{small_w}x{small_h}-{FILTER_RESULT_TEXT}"
+                                                f".{THUMBNAIL_EXT}")
   return img_path
 
 
+def get_training_image_dimensions(slide_number):
+  """
+  Obtain the original and converted dimensions of a slide from the file name of its training image.
+
+  Args:
+    slide_number: The slide number.
+
+  Returns:
+    Tuple consisting of the original width, original height, the converted width, and the converted height.
+  """
+  training_img_path = get_training_image_path(slide_number)
+  return parse_dimensions_from_image_filename(training_img_path)
+
+
+@functools.lru_cache(maxsize=None)
 def parse_dimensions_from_image_filename(filename):
   """
-  Parse an image filename to extract the original width and height and the converted width and height.
+  Parse an image filename to extract the original width and height and the converted width and height. Results
+  are cached on the filename.
 
   Example:
     "TUPAC-TR-011-32x-97103x79079-3034x2471-tile_summary.png" -> (97103, 79079, 3034, 2471)
@@ -618,14 +647,20 @@ def parse_dimensions_from_image_filename(filename):
     filename: The image filename.
 
   Returns:
-    Tuple consisting of the original width, original height, the converted width, and the converted height.
-  """
-  m = re.match(".*-([\d]*)x([\d]*)-([\d]*)x([\d]*).*\..*", filename)
-  large_w = int(m.group(1))
-  large_h = int(m.group(2))
-  small_w = int(m.group(3))
-  small_h = int(m.group(4))
-  return large_w, large_h, small_w, small_h
+    Tuple of ints consisting of the original width, original height, the converted width, and the converted
+    height.
+  """
+  stem = os.path.splitext(os.path.basename(filename))[0]
+  parts = stem.split("-")
+  # the dimensions are the last two consecutive "<w>x<h>" parts; other parts such as "32x" or a suffix are skipped
+  for i in range(len(parts) - 2, -1, -1):
+    large = parts[i].split("x")
+    small = parts[i + 1].split("x")
+    if len(large) == 2 and len(small) == 2 and all(d.isdigit() for d in large + small):
+      large_w, large_h = int(large[0]), int(large[1])
+      small_w, small_h = int(small[0]), int(small[1])
+      return large_w, large_h, small_w, small_h
+  raise ValueError("Could not parse dimensions from image filename: " + filename)
 
 
 def small_to_large_mapping(small_pixel, large_dimensions):
@@ -652,18 +687,21 @@ def training_slide_to_image(slide_number):
 
   Args:
     slide_number: The slide number.
+
+  Returns:
+    The slide number of the converted slide.
   """
 
   img, large_w, large_h, new_w, new_h = slide_to_scaled_pil_image(slide_number)
 
   img_path = get_training_image_path(slide_number, large_w, large_h, new_w, new_h)
   print("Saving image to: " + img_path)
-  if not os.path.exists(DEST_TRAIN_DIR):
-    os.makedirs(DEST_TRAIN_DIR)
+  os.makedirs(DEST_TRAIN_DIR, exist_ok=True)
   img.save(img_path)
 
   thumbnail_path = get_training_thumbnail_path(slide_number, large_w, large_h, new_w, new_h)
   save_thumbnail(img, THUMBNAIL_SIZE, thumbnail_path)
+  return slide_number
 
 
 def slide_to_scaled_pil_image(slide_number):
@@ -679,17 +717,75 @@ def slide_to_scaled_pil_image(slide_number):
   slide_filepath = get_training_slide_path(slide_number)
   print("Opening Slide #%d: %s" % (slide_number, slide_filepath))
   slide = open_slide(slide_filepath)
+  if slide is None:
+    raise OpenSlideError("Could not open slide #%d: %s" % (slide_number, slide_filepath))
 
-  large_w, large_h = slide.dimensions
-  new_w = math.floor(large_w / SCALE_FACTOR)
-  new_h = math.floor(large_h / SCALE_FACTOR)
-  level = slide.get_best_level_for_downsample(SCALE_FACTOR)
-  whole_slide_image = slide.read_region((0, 0), level, slide.level_dimensions[level])
-  whole_slide_image = whole_slide_image.convert("RGB")
-  img = whole_slide_image.resize((new_w, new_h), PIL.Image.BILINEAR)
+  try:
+    large_w, large_h = slide.dimensions
+    new_w = math.floor(large_w / SCALE_FACTOR)
+    new_h = math.floor(large_h / SCALE_FACTOR)
+    # a stored thumbnail at least as large as the target avoids decoding any pyramid level, but only if it covers
+    # the same region as the slide (same aspect ratio to within a pixel), e.g. not a preview of the whole glass slide
+    thumbnail = slide.associated_images.get("thumbnail")
+    if (thumbnail is not None and thumbnail.width >= new_w and thumbnail.height >= new_h
+        and abs(thumbnail.width - thumbnail.height * large_w / large_h) <= 1
+        and abs(thumbnail.height - thumbnail.width * large_h / large_w) <= 1):
+      img = thumbnail.convert("RGB").resize((new_w, new_h), PIL.Image.BILINEAR, reducing_gap=2.0)
+    else:
+      level = slide.get_best_level_for_downsample(SCALE_FACTOR)
+      img = scale_slide_level_by_tiles(slide, level, new_w, new_h)
+  finally:
+    slide.close()
   return img, large_w, large_h, new_w, new_h
 
 
+def scale_slide_level_by_tiles(slide, level, new_w, new_h, tile_size=SCALE_TILE_SIZE):
+  """
+  Scale down a slide level to a PIL image by reading and resizing one region of the level at a time, so that
+  the whole level never has to be held in memory.
+
+  Args:
+    slide: The OpenSlide object.
+    level: The slide level to read from.
+    new_w: Width of the scaled-down image.
+    new_h: Height of the scaled-down image.
+    tile_size: Width and height of each region read from the level.
+
+  Returns:
+    The scaled-down PIL image.
+  """
+  level_w, level_h = slide.level_dimensions[level]
+  level_downsample = slide.level_downsamples[level]
+  scale_w = new_w / level_w
+  scale_h = new_h / level_h
+  # integer part of the downsample, applied with Image.reduce's box filter before the final resize
+  reduce_factor = max(1, math.floor(min(level_w / max(new_w, 1), level_h / max(new_h, 1))))
+
+  img = Image.new("RGB", (new_w, new_h))
+  for y in range(0, level_h, tile_size):
+    for x in range(0, level_w, tile_size):
+      tile_w = min(tile_size, level_w - x)
+      tile_h = min(tile_size, level_h - y)
+      # rounding the region edges (rather than the region sizes) keeps neighboring regions seamless
+      left = round(x * scale_w)
+      top = round(y * scale_h)
+      right = round((x + tile_w) * scale_w)
+      bottom = round((y + tile_h) * scale_h)
+      if right <= left or bottom <= top:
+        continue
+      region = slide.read_region((round(x * level_downsample), round(y * level_downsample)), level, (tile_w, tile_h))
+      # drop alpha before downsampling: Pillow's RGBA -> RGB conversion is a plain channel copy, whereas reducing or
+      # resizing RGBA goes through premultiplied RGBa and back
+      region = region.convert("RGB")
+      if reduce_factor > 1:
+        region = region.reduce(reduce_factor)
+      if region.size != (right - left, bottom - top):
+        region = region.resize((right - left, bottom - top), PIL.Image.BILINEAR)
+      img.paste(region, (left, top))
+      del region
+  return img
+
+
 def slide_to_scaled_np_image(slide_number):
   """
   Convert a WSI training slide to a scaled-down NumPy image.
@@ -727,13 +823,20 @@ def save_thumbnail(pil_img, size, path, display_path=False):
     display_path: If True, display thumbnail path in console.
   """
   max_size = tuple(round(size * d / max(pil_img.size)) for d in pil_img.size)
-  img = pil_img.resize(max_size, PIL.Image.BILINEAR)
+  img = pil_img.resize(max_size, PIL.Image.BILINEAR, reducing_gap=2.0)
   if display_path:
     print("Saving thumbnail to: " + path)
   dir = os.path.dirname(path)
-  if dir != '' and not os.path.exists(dir):
-    os.makedirs(dir)
-  img.save(path)
+  if dir != '':
+    os.makedirs(dir, exist_ok=True)
+  ext = os.path.splitext(path)[1].lower()
+  if ext in (".jpg", ".jpeg"):
+    # 4:2:0 chroma subsampling, optimized Huffman tables, and progressive encoding for smaller thumbnails
+    img.save(path, format="JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True, progressive=True, subsampling=2)
+  elif ext == ".png":
+    img.save(path, format="PNG", optimize=True)
+  else:
+    img.save(path)
 
 
 def get_num_training_slides():
@@ -778,131 +881,110 @@ def singleprocess_training_slides_to_images():
 def multiprocess_training_slides_to_images():
   """
   Convert all WSI training slides to smaller images using multiple processes (one process per core).
-  Each process will process a range of slide numbers.
+  Slides are handed out to the processes one at a time, so a process that draws a large slide does not hold up
+  the remaining slides.
   """
   timer = Time()
 
   # how many processes to use
   num_processes = multiprocessing.cpu_count()
-  pool = multiprocessing.Pool(num_processes)
 
   num_train_images = get_num_training_slides()
   if num_processes > num_train_images:
     num_processes = num_train_images
-  images_per_process = num_train_images / num_processes
 
   print("Number of processes: " + str(num_processes))
   print("Number of training images: " + str(num_train_images))
 
-  # each task specifies a range of slides
-  tasks = []
-  for num_process in range(1, num_processes + 1):
-    start_index = (num_process - 1) * images_per_process + 1
-    end_index = num_process * images_per_process
-    start_index = int(start_index)
-    end_index = int(end_index)
-    tasks.append((start_index, end_index))
-    if start_index == end_index:
-      print("Task #" + str(num_process) + ": Process slide " + str(start_index))
-    else:
-      print("Task #" + str(num_process) + ": Process slides " + str(start_index) + " to " + str(end_index))
+  if num_processes <= 1:
+    training_slide_range_to_images(1, num_train_images)
+  else:
+    with multiprocessing.Pool(num_processes) as pool:
+      for slide_num in pool.imap_unordered(training_slide_to_image, range(1, num_train_images + 1), chunksize=1):
+        print("Done converting slide %d" % slide_num)
 
-  # start tasks
-  results = []
-  for t in tasks:
-    results.append(pool.apply_async(training_slide_range_to_images, t))
+  timer.elapsed_display()
 
-  for result in results:
-    (start_ind, end_ind) = result.get()
-    if start_ind == end_ind:
-      print("Done converting slide %d" % start_ind)
-    else:
-      print("Done converting slides %d through %d" % (start_ind, end_ind))
 
-  timer.elapsed_display()
+def slide_dimensions(slide_number):
+  """
+  Obtain the width and height of a WSI training slide.
+
+  Args:
+    slide_number: The slide number.
+
+  Returns:
+    Tuple consisting of the slide width and height.
+  """
+  slide_filepath = get_training_slide_path(slide_number)
+  slide = open_slide(slide_filepath)
+  if slide is None:
+    raise OpenSlideError("Could not open slide #%d: %s" % (slide_number, slide_filepath))
+  try:
+    (width, height) = slide.dimensions
+  finally:
+    slide.close()
+  print("Opening Slide #%d: %s\n  Dimensions: {:,d} x {:,d}".format(width, height) % (slide_number, slide_filepath))
+  return width, height
 
 
 def slide_stats():
   """
-  Display statistics/graphs about training slides.
+  Display statistics about training slides and save them along with graphs to the stats directory.
   """
+  # matplotlib is only needed here, so import it lazily with a non-interactive backend
+  import matplotlib
+  matplotlib.use('Agg')
+  import matplotlib.pyplot as plt
+
   t = Time()
 
-  if not os.path.exists(STATS_DIR):
-    os.makedirs(STATS_DIR)
+  os.makedirs(STATS_DIR, exist_ok=True)
 
   num_train_images = get_num_training_slides()
-  slide_stats = []
-  for slide_num in range(1, num_train_images + 1):
-    slide_filepath = get_training_slide_path(slide_num)
-    print("Opening Slide #%d: %s" % (slide_num, slide_filepath))
-    slide = open_slide(slide_filepath)
-    (width, height) = slide.dimensions
-    print("  Dimensions: {:,d} x {:,d}".format(width, height))
-    slide_stats.append((width, height))
-
-  max_width = 0
-  max_height = 0
-  min_width = sys.maxsize
-  min_height = sys.maxsize
-  total_width = 0
-  total_height = 0
-  total_size = 0
-  which_max_width = 0
-  which_max_height = 0
-  which_min_width = 0
-  which_min_height = 0
-  max_size = 0
-  min_size = sys.maxsize
-  which_max_size = 0
-  which_min_size = 0
-  for z in range(0, num_train_images):
-    (width, height) = slide_stats[z]
-    if width > max_width:
-      max_width = width
-      which_max_width = z + 1
-    if width < min_width:
-      min_width = width
-      which_min_width = z + 1
-    if height > max_height:
-      max_height = height
-      which_max_height = z + 1
-    if height < min_height:
-      min_height = height
-      which_min_height = z + 1
-    size = width * height
-    if size > max_size:
-      max_size = size
-      which_max_size = z + 1
-    if size < min_size:
-      min_size = size
-      which_min_size = z + 1
-    total_width = total_width + width
-    total_height = total_height + height
-    total_size = total_size + size
-
-  avg_width = total_width / num_train_images
-  avg_height = total_height / num_train_images
-  avg_size = total_size / num_train_images
-
-  stats_string = ""
-  stats_string += "%-11s {:14,d} pixels (slide #%d)".format(max_width) % ("Max width:", which_max_width)
-  stats_string += "\n%-11s {:14,d} pixels (slide #%d)".format(max_height) % ("Max height:", which_max_height)
-  stats_string += "\n%-11s {:14,d} pixels (slide #%d)".format(max_size) % ("Max size:", which_max_size)
-  stats_string += "\n%-11s {:14,d} pixels (slide #%d)".format(min_width) % ("Min width:", which_min_width)
-  stats_string += "\n%-11s {:14,d} pixels (slide #%d)".format(min_height) % ("Min height:", which_min_height)
-  stats_string += "\n%-11s {:14,d} pixels (slide #%d)".format(min_size) % ("Min size:", which_min_size)
-  stats_string += "\n%-11s {:14,d} pixels".format(round(avg_width)) % "Avg width:"
-  stats_string += "\n%-11s {:14,d} pixels".format(round(avg_height)) % "Avg height:"
-  stats_string += "\n%-11s {:14,d} pixels".format(round(avg_size)) % "Avg size:"
-  stats_string += "\n"
+  # reading slide headers is I/O bound and OpenSlide releases the GIL, so threads are sufficient
+  with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+    slide_stats = list(executor.map(slide_dimensions, range(1, num_train_images + 1)))
+
+  stats = np.asarray(slide_stats, dtype=np.int64)
+  widths = stats[:, 0]
+  heights = stats[:, 1]
+  sizes = widths * heights
+
+  which_max_width = int(widths.argmax()) + 1
+  which_max_height = int(heights.argmax()) + 1
+  which_max_size = int(sizes.argmax()) + 1
+  which_min_width = int(widths.argmin()) + 1
+  which_min_height = int(heights.argmin()) + 1
+  which_min_size = int(sizes.argmin()) + 1
+  max_width = int(widths[which_max_width - 1])
+  max_height = int(heights[which_max_height - 1])
+  max_size = int(sizes[which_max_size - 1])
+  min_width = int(widths[which_min_width - 1])
+  min_height = int(heights[which_min_height - 1])
+  min_size = int(sizes[which_min_size - 1])
+
+  avg_width = float(widths.mean())
+  avg_height = float(heights.mean())
+  avg_size = float(sizes.mean())
+
+  stats_lines = [
+    "%-11s {:14,d} pixels (slide #%d)".format(max_width) % ("Max width:", which_max_width),
+    "%-11s {:14,d} pixels (slide #%d)".format(max_height) % ("Max height:", which_max_height),
+    "%-11s {:14,d} pixels (slide #%d)".format(max_size) % ("Max size:", which_max_size),
+    "%-11s {:14,d} pixels (slide #%d)".format(min_width) % ("Min width:", which_min_width),
+    "%-11s {:14,d} pixels (slide #%d)".format(min_height) % ("Min height:", which_min_height),
+    "%-11s {:14,d} pixels (slide #%d)".format(min_size) % ("Min size:", which_min_size),
+    "%-11s {:14,d} pixels".format(round(avg_width)) % "Avg width:",
+    "%-11s {:14,d} pixels".format(round(avg_height)) % "Avg height:",
+    "%-11s {:14,d} pixels".format(round(avg_size)) % "Avg size:"
+  ]
+  stats_string = "\n".join(stats_lines) + "\n"
   print(stats_string)
 
-  stats_string += "\nslide number,width,height"
-  for i in range(0, len(slide_stats)):
-    (width, height) = slide_stats[i]
-    stats_string += "\n%d,%d,%d" % (i + 1, width, height)
-  stats_string += "\n"
+  csv_lines = ["slide number,width,height"]
+  csv_lines.extend("%d,%d,%d" % (i + 1, width, height) for i, (width, height) in enumerate(slide_stats))
+  stats_string += "\n" + "\n".join(csv_lines) + "\n"
 
   stats_file = open(os.path.join(STATS_DIR, "stats.txt"), "w")
   stats_file.write(stats_string)
@@ -910,60 +992,54 @@ def slide_stats():
 
   t.elapsed_display()
 
-  x, y = zip(*slide_stats)
+  x, y = widths, heights
   colors = np.random.rand(num_train_images)
-  sizes = [10 for n in range(num_train_images)]
-  plt.scatter(x, y, s=sizes, c=colors, alpha=0.7)
+  marker_sizes = [10 for n in range(num_train_images)]
+  plt.scatter(x, y, s=marker_sizes, c=colors, cmap="prism", alpha=0.7)
   plt.xlabel("width (pixels)")
   plt.ylabel("height (pixels)")
   plt.title("SVS Image Sizes")
-  plt.set_cmap("prism")
   plt.tight_layout()
   plt.savefig(os.path.join(STATS_DIR, "svs-image-sizes.png"))
-  plt.show()
 
   plt.clf()
-  plt.scatter(x, y, s=sizes, c=colors, alpha=0.7)
+  plt.scatter(x, y, s=marker_sizes, c=colors, cmap="prism", alpha=0.7)
   plt.xlabel("width (pixels)")
   plt.ylabel("height (pixels)")
   plt.title("SVS Image Sizes (Labeled with slide numbers)")
-  plt.set_cmap("prism")
-  for i in range(num_train_images):
-    snum = i + 1
-    plt.annotate(str(snum), (x[i], y[i]))
+  # plain Text artists are cheaper to create and lay out than Annotations and render identically here
+  ax = plt.gca()
+  for snum, (xi, yi) in enumerate(zip(x, y), 1):
+    ax.text(xi, yi, str(snum))
   plt.tight_layout()
   plt.savefig(os.path.join(STATS_DIR, "svs-image-sizes-slide-numbers.png"))
-  plt.show()
 
   plt.clf()
-  area = [w * h / 1000000 for (w, h) in slide_stats]
+  area = sizes / 1000000
   plt.hist(area, bins=64)
   plt.xlabel("width x height (M of pixels)")
   plt.ylabel("# images")
   plt.title("Distribution of image sizes in millions of pixels")
   plt.tight_layout()
   plt.savefig(os.path.join(STATS_DIR, "distribution-of-svs-image-sizes.png"))
-  plt.show()
 
   plt.clf()
-  whratio = [w / h for (w, h) in slide_stats]
+  whratio = widths / heights
   plt.hist(whratio, bins=64)
   plt.xlabel("width to height ratio")
   plt.ylabel("# images")
   plt.title("Image shapes (width to height)")
   plt.tight_layout()
   plt.savefig(os.path.join(STATS_DIR, "w-to-h.png"))
-  plt.show()
 
   plt.clf()
-  hwratio = [h / w for (w, h) in slide_stats]
+  hwratio = heights / widths
   plt.hist(hwratio, bins=64)
   plt.xlabel("height to width ratio")
   plt.ylabel("# images")
   plt.title("Image shapes (height to width)")
   plt.tight_layout()
   plt.savefig(os.path.join(STATS_DIR, "h-to-w.png"))
-  plt.show()
 
 
 def slide_info(display_all_properties=False):
@@ -983,26 +1059,31 @@ def slide_info(display_all_properties=False):
     slide_filepath = get_training_slide_path(slide_num)
     print("\nOpening Slide #%d: %s" % (slide_num, slide_filepath))
     slide = open_slide(slide_filepath)
-    print("Level count: %d" % slide.level_count)
-    print("Level dimensions: " + str(slide.level_dimensions))
-    print("Level downsamples: " + str(slide.level_downsamples))
-    print("Dimensions: " + str(slide.dimensions))
-    objective_power = int(slide.properties[openslide.PROPERTY_NAME_OBJECTIVE_POWER])
-    print("Objective power: " + str(objective_power))
-    if objective_power == 20:
-      obj_pow_20_list.append(slide_num)
-    elif objective_power == 40:
-      obj_pow_40_list.append(slide_num)
-    else:
-      obj_pow_other_list.append(slide_num)
-    print("Associated images:")
-    for ai_key in slide.associated_images.keys():
-      print("  " + str(ai_key) + ": " + str(slide.associated_images.get(ai_key)))
-    print("Format: " + str(slide.detect_format(slide_filepath)))
-    if display_all_properties:
-      print("Properties:")
-      for prop_key in slide.properties.keys():
-        print("  Property: " + str(prop_key) + ", value: " + str(slide.properties.get(prop_key)))
+    if slide is None:
+      raise OpenSlideError("Could not open slide #%d: %s" % (slide_num, slide_filepath))
+    try:
+      print("Level count: %d" % slide.level_count)
+      print("Level dimensions: " + str(slide.level_dimensions))
+      print("Level downsamples: " + str(slide.level_downsamples))
+      print("Dimensions: " + str(slide.dimensions))
+      objective_power = int(slide.properties[openslide.PROPERTY_NAME_OBJECTIVE_POWER])
+      print("Objective power: " + str(objective_power))
+      if objective_power == 20:
+        obj_pow_20_list.append(slide_num)
+      elif objective_power == 40:
+        obj_pow_40_list.append(slide_num)
+      else:
+        obj_pow_other_list.append(slide_num)
+      print("Associated images:")
+      for ai_key in slide.associated_images.keys():
+        print("  " + str(ai_key) + ": " + str(slide.associated_images.get(ai_key)))
+      print("Format: " + str(slide.detect_format(slide_filepath)))
+      if display_all_properties:
+        print("Properties:")
+        for prop_key in slide.properties.keys():
+          print("  Property: " + str(prop_key) + ", value: " + str(slide.properties.get(prop_key)))
+    finally:
+      slide.close()
 
   print("\n\nSlide Magnifications:")
   print("  20x Slides: " + str(obj_pow_20_list))
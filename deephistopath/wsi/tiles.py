@@ -24,6 +24,7 @@ import math
 import matplotlib.pyplot as plt
 import multiprocessing
 import numpy as np
+from openslide import OpenSlideError
 import os
 from PIL import Image, ImageDraw, ImageFont
 from enum import Enum
@@ -567,10 +568,15 @@ def tile_to_pil_tile(tile):
   t = tile
   slide_filepath = slide.get_training_slide_path(t.slide_num)
   s = slide.open_slide(slide_filepath)
+  if s is None:
+    raise OpenSlideError("Could not open slide #%d: %s" % (t.slide_num, slide_filepath))
 
   x, y = t.o_c_s, t.o_r_s
   w, h = t.o_c_e - t.o_c_s, t.o_r_e - t.o_r_s
-  tile_region = s.read_region((x, y), 0, (w, h))
+  try:
+    tile_region = s.read_region((x, y), 0, (w, h))
+  finally:
+    s.close()
   # RGBA to RGB
   pil_img = tile_region.convert("RGB")
   return pil_img
@@ -606,8 +612,7 @@ def save_display_tile(tile, save=True, display=False):
     t = Time()
     img_path = slide.get_tile_image_path(tile)
     dir = os.path.dirname(img_path)
-    if not os.path.exists(dir):
-      os.makedirs(dir)
+    os.makedirs(dir, exist_ok=True)
     tile_pil_img.save(img_path)
     print("%-20s | Time: %-14s  Name: %s" % ("Save Tile", str(t.elapsed()), img_path))
 
@@ -857,8 +862,8 @@ def multiprocess_filtered_images_to_tiles(display=False, save_summary=True, save
   timer = Time()
   print("Generating tile summaries (multiprocess)\n")
 
-  if save_summary and not os.path.exists(slide.TILE_SUMMARY_DIR):
-    os.makedirs(slide.TILE_SUMMARY_DIR)
+  if save_summary:
+    os.makedirs(slide.TILE_SUMMARY_DIR, exist_ok=True)
 
   # how many processes to use
   num_processes = multiprocessing.cpu_count()
@@ -16,6 +16,7 @@
 
 import datetime
 import numpy as np
+import time
 from PIL import Image, ImageDraw, ImageFont
 
 # If True, display additional NumPy array stats (min, max, mean, is_binary).
@@ -136,13 +137,13 @@ class Time:
   """
 
   def __init__(self):
-    self.start = datetime.datetime.now()
+    self.start = time.perf_counter_ns()
 
   def elapsed_display(self):
     time_elapsed = self.elapsed()
     print("Time elapsed: " + str(time_elapsed))
 
   def elapsed(self):
-    self.end = datetime.datetime.now()
-    time_elapsed = self.end - self.start
+    self.end = time.perf_counter_ns()
+    time_elapsed = datetime.timedelta(microseconds=(self.end - self.start) // 1000)
     return time_elapsed